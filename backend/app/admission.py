@@ -0,0 +1,224 @@
+# backend/app/admission.py
+
+import os
+import math
+import time
+import asyncio
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import cv2
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ===============================
+# ⚙️ Admission settings
+# ===============================
+# Cost unit = one megapixel frame run through detection + feature extraction.
+# A 15 s 720p clip is ~415, a 60 s 1080p clip ~3700. Default budget scales with cores.
+_cpus = os.cpu_count() or 1
+ADMISSION_BUDGET = float(os.getenv("ADMISSION_BUDGET", 1500 * _cpus))     # total cost in flight
+ADMISSION_VIDEO_SHARE = float(os.getenv("ADMISSION_VIDEO_SHARE", 0.8))    # max share of budget videos may hold
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 32))           # waiters per lane before 429
+ADMISSION_IMAGE_WAIT = float(os.getenv("ADMISSION_IMAGE_WAIT", 30))       # seconds an image may wait before 503
+ADMISSION_VIDEO_WAIT = float(os.getenv("ADMISSION_VIDEO_WAIT", 5))        # seconds a video may wait before 503
+# Inference threads per lane. Each lane has its own executor, so running videos can
+# never occupy the threads images need (or the shared pool used for uploads).
+ADMISSION_IMAGE_WORKERS = int(os.getenv("ADMISSION_IMAGE_WORKERS", max(2, _cpus // 2)))
+ADMISSION_VIDEO_WORKERS = int(os.getenv("ADMISSION_VIDEO_WORKERS", max(1, _cpus // 2)))
+
+IMAGE, VIDEO = "image", "video"
+LANES = (IMAGE, VIDEO)  # priority order
+
+IMAGE_BASE_COST = 2.0      # an image is a single frame, plus OCR/plot overhead
+DEFAULT_RATE = 200.0       # cost units/sec assumed until we have measurements
+RATE_WINDOW = 60.0         # seconds of completions used to measure throughput
+
+
+def estimate_cost(file_path, lane, file_size):
+    """
+    Cheap cost estimate from metadata only (nothing is decoded).
+    Videos: frame count x resolution in megapixels. Images: scaled by file size.
+    """
+    if lane == IMAGE:
+        return IMAGE_BASE_COST + file_size / (1024 * 1024)
+
+    cap = cv2.VideoCapture(file_path)
+    try:
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    finally:
+        cap.release()
+
+    if frames <= 0 or width <= 0 or height <= 0:
+        # Container without usable metadata → assume 30 frames of 720p per MB
+        return max(file_size / (1024 * 1024), 1.0) * 30 * (1280 * 720) / 1e6
+    return frames * (width * height) / 1e6
+
+
+class _Waiter:
+    __slots__ = ("cost", "future")
+
+    def __init__(self, cost, future):
+        self.cost = cost
+        self.future = future
+
+
+class AdmissionController:
+    """
+    Global cost budget with strict-priority lanes.
+
+    Images are always dispatched before videos, and videos may only hold
+    `video_share` of the budget so images keep headroom under a video burst.
+    Each lane also caps how many requests run at once and runs inference on
+    its own executor of that size (see run()).
+    Requests that cannot be queued get a 429, requests that wait too long a
+    503; both carry a Retry-After estimated from observed throughput.
+    All state is touched from the event loop only, so no locks are needed.
+    """
+
+    def __init__(self, budget=ADMISSION_BUDGET, video_share=ADMISSION_VIDEO_SHARE,
+                 max_queue=ADMISSION_MAX_QUEUE, image_wait=ADMISSION_IMAGE_WAIT,
+                 video_wait=ADMISSION_VIDEO_WAIT, image_workers=ADMISSION_IMAGE_WORKERS,
+                 video_workers=ADMISSION_VIDEO_WORKERS):
+        self.budget = budget
+        self.lane_limits = {IMAGE: budget, VIDEO: budget * video_share}
+        self.max_wait = {IMAGE: image_wait, VIDEO: video_wait}
+        self.max_queue = max_queue
+        self.max_running = {IMAGE: image_workers, VIDEO: video_workers}
+        self.executors = {
+            lane: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{lane}-inference")
+            for lane, workers in self.max_running.items()
+        }
+        self.in_use = {lane: 0.0 for lane in LANES}
+        self.running = {lane: 0 for lane in LANES}
+        self.waiting = {lane: deque() for lane in LANES}
+        self.completed = deque()  # (start, end, cost) of recently finished requests
+        self.rejected = {429: 0, 503: 0}
+
+    def _fits(self, lane, cost):
+        total = sum(self.in_use.values())
+        return (self.running[lane] < self.max_running[lane]
+                and total + cost <= self.budget
+                and self.in_use[lane] + cost <= self.lane_limits[lane])
+
+    def _queued(self, lane):
+        return sum(not w.future.done() for w in self.waiting[lane])
+
+    def _forget(self, lane, waiter):
+        """Drop a timed-out or cancelled waiter so it no longer counts as queued."""
+        waiter.future.cancel()
+        try:
+            self.waiting[lane].remove(waiter)
+        except ValueError:
+            pass
+        self._dispatch()
+
+    def _reserve(self, lane, cost):
+        self.in_use[lane] += cost
+        self.running[lane] += 1
+
+    def _release(self, lane, cost, start=None):
+        self.in_use[lane] = max(self.in_use[lane] - cost, 0.0)
+        self.running[lane] -= 1
+        if start is not None:
+            self.completed.append((start, time.monotonic(), cost))
+        self._dispatch()
+
+    def throughput(self):
+        """
+        Aggregate completed cost per wall-clock second over the last RATE_WINDOW,
+        so concurrent requests and both lanes count towards one server-wide rate.
+        """
+        now = time.monotonic()
+        while self.completed and self.completed[0][1] < now - RATE_WINDOW:
+            self.completed.popleft()
+        if not self.completed:
+            return DEFAULT_RATE
+        span = now - min(start for start, _, _ in self.completed)
+        return sum(cost for _, _, cost in self.completed) / max(span, 1.0)
+
+    def _dispatch(self):
+        for lane in LANES:
+            queue = self.waiting[lane]
+            while queue:
+                waiter = queue[0]
+                if waiter.future.done():  # timed out or cancelled
+                    queue.popleft()
+                    continue
+                if not self._fits(lane, waiter.cost):
+                    break
+                queue.popleft()
+                self._reserve(lane, waiter.cost)
+                waiter.future.set_result(None)
+            if queue:
+                return  # strict priority: lower lanes wait behind a blocked higher lane
+
+    def retry_after(self, lane):
+        backlog = sum(self.in_use.values())
+        for l in LANES[:LANES.index(lane) + 1]:
+            backlog += sum(w.cost for w in self.waiting[l] if not w.future.done())
+        return int(min(max(math.ceil(backlog / max(self.throughput(), 1e-6)), 1), 120))
+
+    def _reject(self, status, lane, detail):
+        self.rejected[status] += 1
+        raise HTTPException(status_code=status, detail=detail,
+                            headers={"Retry-After": str(self.retry_after(lane))})
+
+    @asynccontextmanager
+    async def admit(self, lane, cost):
+        """Hold `cost` units of the budget in `lane` for the duration of the block."""
+        cost = min(cost, self.lane_limits[lane])  # oversized requests may still run alone
+
+        higher_waiting = any(self._queued(l) for l in LANES[:LANES.index(lane) + 1])
+        if not higher_waiting and self._fits(lane, cost):
+            self._reserve(lane, cost)
+        else:
+            if self._queued(lane) >= self.max_queue:
+                self._reject(429, lane, f"Too many {lane} requests queued, try again later")
+
+            future = asyncio.get_running_loop().create_future()
+            waiter = _Waiter(cost, future)
+            self.waiting[lane].append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait[lane])
+            except asyncio.TimeoutError:
+                if not future.done():
+                    self._forget(lane, waiter)
+                    self._reject(503, lane, f"Server busy, {lane} analysis could not be scheduled")
+            except BaseException:
+                # client went away while queued
+                if future.done() and not future.cancelled():
+                    self._release(lane, cost)
+                else:
+                    self._forget(lane, waiter)
+                raise
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(lane, cost, start)
+
+    async def run(self, lane, fn, *args, **kwargs):
+        """Run blocking inference on the lane's own executor (call inside admit())."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executors[lane], functools.partial(fn, *args, **kwargs))
+
+    def stats(self):
+        return {
+            "budget": self.budget,
+            "in_use": {lane: round(v, 1) for lane, v in self.in_use.items()},
+            "running": dict(self.running),
+            "max_running": dict(self.max_running),
+            "queued": {lane: self._queued(lane) for lane in LANES},
+            "rejected": dict(self.rejected),
+            "throughput": round(self.throughput(), 1),
+        }
+
+
+admission = AdmissionController()
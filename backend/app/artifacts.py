@@ -0,0 +1,114 @@
+# backend/app/artifacts.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ===============================
+# ⚙️ Artifact encoder settings
+# ===============================
+ARTIFACT_FORMAT = os.getenv("ARTIFACT_FORMAT", "jpeg").lower()      # jpeg | webp | png
+ARTIFACT_MAX_SIZE = int(os.getenv("ARTIFACT_MAX_SIZE", 640))        # longest side in px, 0 keeps full size
+ARTIFACT_QUALITY = int(os.getenv("ARTIFACT_QUALITY", 80))           # 1-100 for jpeg/webp
+ARTIFACT_OVERLAY = os.getenv("ARTIFACT_OVERLAY", "box").lower()     # none | box | edges
+ARTIFACT_WORKERS = int(os.getenv("ARTIFACT_WORKERS", 4))
+
+_formats = {
+    "jpeg": (".jpg", "image/jpeg"),
+    "jpg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+    "png": (".png", "image/png"),
+}
+_overlays = ("none", "box", "edges")
+
+# Fail fast on bad settings instead of returning 500 on every request
+if ARTIFACT_FORMAT not in _formats:
+    raise ValueError(f"Invalid ARTIFACT_FORMAT={ARTIFACT_FORMAT!r}, expected one of {', '.join(_formats)}")
+if ARTIFACT_OVERLAY not in _overlays:
+    raise ValueError(f"Invalid ARTIFACT_OVERLAY={ARTIFACT_OVERLAY!r}, expected one of {', '.join(_overlays)}")
+
+# cv2 releases the GIL while resizing/encoding, so a thread pool is enough
+_executor = ThreadPoolExecutor(max_workers=ARTIFACT_WORKERS, thread_name_prefix="artifact")
+
+
+def _encode_params(fmt, quality):
+    if fmt in ("jpeg", "jpg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return [cv2.IMWRITE_PNG_COMPRESSION, 3]
+
+
+def _draw_edges(img, x, y, bw, bh):
+    """
+    Blend a Laplacian edge-energy map over the face region.
+    Visual aid only: this is NOT model attribution/saliency.
+    """
+    h, w = img.shape[:2]
+    x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + bw, w), min(y + bh, h)
+    if x1 <= x0 or y1 <= y0:
+        return
+    region = img[y0:y1, x0:x1]
+    gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+    energy = np.abs(cv2.Laplacian(gray, cv2.CV_32F, ksize=3))
+    energy = cv2.GaussianBlur(energy, (0, 0), sigmaX=max((x1 - x0) / 40, 1))
+    energy = cv2.normalize(energy, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    heat = cv2.applyColorMap(energy, cv2.COLORMAP_JET)
+    img[y0:y1, x0:x1] = cv2.addWeighted(region, 0.5, heat, 0.5, 0)
+
+
+def encode_artifact(img, boxes=None, label=None, color=(0, 0, 255),
+                    fmt=None, max_size=None, quality=None, overlay=None):
+    """
+    Resize an image to a thumbnail, optionally draw face boxes / edge map
+    and a label on it, and encode it into an in-memory buffer.
+
+    boxes are (x, y, w, h) in pixel coordinates of the original image.
+    Returns {"data": bytes, "ext": ".jpg", "content_type": "image/jpeg"}.
+    """
+    fmt = (fmt or ARTIFACT_FORMAT).lower()
+    max_size = ARTIFACT_MAX_SIZE if max_size is None else max_size
+    quality = ARTIFACT_QUALITY if quality is None else quality
+    overlay = (overlay or ARTIFACT_OVERLAY).lower()
+    if fmt not in _formats:
+        raise ValueError(f"Unsupported artifact format: {fmt}")
+    if overlay not in _overlays:
+        raise ValueError(f"Unsupported artifact overlay: {overlay}")
+
+    h, w = img.shape[:2]
+    scale = 1.0
+    if max_size and max(h, w) > max_size:
+        scale = max_size / max(h, w)
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    elif overlay != "none" or label:
+        img = img.copy()  # never draw on the caller's frame
+
+    for (x, y, bw, bh) in boxes or []:
+        x, y, bw, bh = int(x * scale), int(y * scale), int(bw * scale), int(bh * scale)
+        if overlay == "edges":
+            _draw_edges(img, x, y, bw, bh)
+        if overlay in ("box", "edges"):
+            cv2.rectangle(img, (x, y), (x + bw, y + bh), color, 2)
+
+    if label:
+        cv2.putText(img, label, (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(img, label, (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 1, cv2.LINE_AA)
+
+    ext, content_type = _formats[fmt]
+    ok, buf = cv2.imencode(ext, img, _encode_params(fmt, quality))
+    if not ok:
+        raise ValueError(f"Failed to encode artifact as {fmt}")
+    return {"data": buf.tobytes(), "ext": ext, "content_type": content_type}
+
+
+def encode_artifacts(jobs):
+    """
+    Encode many artifacts on the shared thread pool.
+    jobs is a list of kwargs dicts for encode_artifact; results keep the same order.
+    """
+    futures = [_executor.submit(encode_artifact, **job) for job in jobs]
+    return [f.result() for f in futures]
@@ -2,10 +2,7 @@
 import os
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.fftpack import dct
-import tempfile
-import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import easyocr
@@ -14,6 +11,7 @@ import onnxruntime as ort
 import time
 import torch
 import mediapipe as mp
+from app.artifacts import encode_artifact, encode_artifacts
 
 
 # Path to your ONNX model
@@ -94,7 +92,6 @@ def extract_beta_vector(img):
         return None
     
 
-import uuid
 def predict_image(image_path, has_text=False, conf_threshold=0.25):
     start = time.time()
     img = cv2.imread(image_path)
@@ -109,7 +106,6 @@ def predict_image(image_path, has_text=False, conf_threshold=0.25):
     detector = mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5)
     rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     results = detector.process(rgb_img)
-    save_dir = tempfile.mkdtemp()
 
     if results.detections:
         face_probs, face_betas = [], []
@@ -139,21 +135,17 @@ def predict_image(image_path, has_text=False, conf_threshold=0.25):
             result["real_confidence"] = float(avg_probs[0])
             result["deepfake_og_confidence"] = float(avg_probs[1])
             result["deepfake_confidence"] = float(avg_probs[2])
+            boxes = []
             for detection in results.detections:
                 bboxC = detection.location_data.relative_bounding_box
                 h, w, c = img.shape
-                x, y, bw, bh = int(bboxC.xmin * w), int(bboxC.ymin * h), \
-                            int(bboxC.width * w), int(bboxC.height * h)
-                cv2.rectangle(img, (x, y), (x+bw, y+bh), (0, 255, 0), 2)
-            os.makedirs(save_dir, exist_ok=True)
-            save_path = os.path.join(save_dir, f"prediction_{uuid.uuid4().hex}.png")
-
-            plt.imshow(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-            plt.title(f"Predicted: {label_map[pred_class]}")
-            plt.axis('off')
-            plt.savefig(save_path, bbox_inches="tight")
-            
-            result["saved_plot"] = save_path
+                boxes.append((int(bboxC.xmin * w), int(bboxC.ymin * h),
+                              int(bboxC.width * w), int(bboxC.height * h)))
+
+            # ✅ Encode annotated thumbnail in memory
+            result["annotated_image"] = encode_artifact(
+                img, boxes=boxes, label=f"Predicted: {label_map[pred_class]}", color=(0, 255, 0)
+            )
         else:
             result = {
                 "prediction": "real",
@@ -161,7 +153,7 @@ def predict_image(image_path, has_text=False, conf_threshold=0.25):
                 "deepfake_og_confidence": 0.0,
                 "deepfake_confidence": 0.0,
                 "prediction_confidence": 0.0,
-                "saved_plot": None,
+                "annotated_image": None,
 
                 }
     end = time.time()
@@ -174,21 +166,62 @@ def predict_image(image_path, has_text=False, conf_threshold=0.25):
 # Video Analyzer
 # ===============================
 
-def analyze_video(video_path,has_text=False, conf_threshold=0.25):
+def _progress_summary(idx, total_frames, window_start, window_sum, window_faces,
+                      running_sum, face_frames, early_stopped):
+    """JSON-safe snapshot of a window of frames and the running verdict so far."""
+    window_probs = window_sum / max(window_faces, 1)
+    running_probs = running_sum / max(face_frames, 1)
+    running_class = int(np.argmax(running_probs))
+    return {
+        "frame_index": int(idx),
+        "total_frames": int(total_frames),
+        "window": {
+            "start": int(window_start),
+            "end": int(idx),
+            "face_frames": int(window_faces),
+            "avg_probs": {label_map[k]: float(window_probs[k]) for k in label_map},
+        },
+        "running": {
+            "face_frames": int(face_frames),
+            "avg_probs": {label_map[k]: float(running_probs[k]) for k in label_map},
+            "prediction": label_map[running_class] if face_frames else None,
+            "confidence": float(running_probs[running_class]),
+        },
+        "early_stopped": early_stopped,
+    }
+
+
+def analyze_video(video_path,has_text=False, conf_threshold=0.25,
+                  on_progress=None, progress_every=10,
+                  early_stop_confidence=None, min_face_frames=30, stop_event=None):
+    """
+    on_progress(summary) is called every `progress_every` frames with window and running averages.
+    If early_stop_confidence is set, analysis stops once the running verdict over face frames
+    reaches it with at least `min_face_frames` face frames. Setting stop_event aborts analysis.
+    """
     start = time.time()
     cap = cv2.VideoCapture(video_path)
     detector = mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5)
 
     frame_predictions, frame_confidences, frame_indices = [], [], []
     frame_raw_probs, frame_raw_inputs, suspicious_frames = [], [], []
+    frame_boxes = []
 
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     print(f"🎥 Total Frames: {total_frames}, FPS: {cap.get(cv2.CAP_PROP_FPS)}")
 
     num_classes = len(label_map)  # Ensure label_map is defined globally
 
+    # Running verdict over face frames only (no_face frames carry no signal)
+    running_sum, face_frames = np.zeros(num_classes), 0
+    window_sum, window_faces, window_start = np.zeros(num_classes), 0, 0
+    early_stopped = False
+
     idx = 0
     while True:
+        if stop_event is not None and stop_event.is_set():
+            print(f"⏹️ Analysis aborted at frame {idx}")
+            break
         ret, frame = cap.read()
         if not ret: break
 
@@ -200,12 +233,13 @@ def analyze_video(video_path,has_text=False, conf_threshold=0.25):
             if has_text:
                 frame = remove_text(frame, conf_threshold)
 
-            frame_face_probs, frame_face_betas = [], []
+            frame_face_probs, frame_face_betas, face_boxes = [], [], []
             for detection in results.detections:
                 bboxC = detection.location_data.relative_bounding_box
                 h, w, c = frame.shape
                 x, y, bw, bh = int(bboxC.xmin * w), int(bboxC.ymin * h), \
                                int(bboxC.width * w), int(bboxC.height * h)
+                face_boxes.append((x, y, bw, bh))
                 face_crop = frame[y:y+bh, x:x+bw]
 
                 beta = extract_beta_vector(face_crop)
@@ -224,6 +258,7 @@ def analyze_video(video_path,has_text=False, conf_threshold=0.25):
                 frame_indices.append(idx)
                 frame_raw_probs.append(avg_face_probs)
                 frame_raw_inputs.append(np.mean(frame_face_betas, axis=0))
+                frame_boxes.append(face_boxes)
             else:
                 # Face not usable → push zero vector
                 frame_predictions.append("no_face")
@@ -231,6 +266,7 @@ def analyze_video(video_path,has_text=False, conf_threshold=0.25):
                 frame_indices.append(idx)
                 frame_raw_probs.append(np.zeros(num_classes))
                 frame_raw_inputs.append(np.zeros(63))  # match beta dim
+                frame_boxes.append([])
         else:
             # No face detected → push zero vector
             frame_predictions.append("no_face")
@@ -238,30 +274,55 @@ def analyze_video(video_path,has_text=False, conf_threshold=0.25):
             frame_indices.append(idx)
             frame_raw_probs.append(np.zeros(num_classes))
             frame_raw_inputs.append(np.zeros(63))
+            frame_boxes.append([])
+
+        if frame_predictions[-1] != "no_face":
+            running_sum += frame_raw_probs[-1]
+            window_sum += frame_raw_probs[-1]
+            face_frames += 1
+            window_faces += 1
+
+        if early_stop_confidence is not None and face_frames >= min_face_frames:
+            early_stopped = bool((running_sum / face_frames).max() >= early_stop_confidence)
+
+        if on_progress is not None and (idx + 1 - window_start >= progress_every or early_stopped):
+            on_progress(_progress_summary(idx, total_frames, window_start, window_sum, window_faces,
+                                          running_sum, face_frames, early_stopped))
+            window_sum, window_faces, window_start = np.zeros(num_classes), 0, idx + 1
 
         idx += 1
+        if early_stopped:
+            print(f"⏩ Early verdict after {idx} frames ({face_frames} with faces)")
+            break
 
     cap.release()
 
+    # Flush the last partial window
+    if on_progress is not None and idx > window_start:
+        on_progress(_progress_summary(idx - 1, total_frames, window_start, window_sum, window_faces,
+                                      running_sum, face_frames, early_stopped))
+
     # Convert lists → arrays (safe now)
     frame_raw_probs = np.array(frame_raw_probs)
     frame_raw_inputs = np.array(frame_raw_inputs)
 
-    return frame_indices, frame_predictions, frame_confidences, frame_raw_probs, frame_raw_inputs
+    return frame_indices, frame_predictions, frame_confidences, frame_raw_probs, frame_raw_inputs, frame_boxes, early_stopped
 
 
 
 # ===============================
 # 📊 Step 9: Plotting (Updated)
 # ===============================
-import os
-import tempfile
-import matplotlib.pyplot as plt
+import io
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.lines import Line2D
 from matplotlib.patches import Patch
 
 def plot_confidences(frame_indices, frame_predictions, frame_confidences, frame_raw_probs, label_map):
-    fig = plt.figure(figsize=(18, 6))
+    # Per-call Figure on an Agg canvas: no global pyplot state, safe across worker threads
+    fig = Figure(figsize=(18, 6))
+    FigureCanvasAgg(fig)
     gs = fig.add_gridspec(3, 2, width_ratios=[2, 1])
 
     # -------------------- MAIN PLOT --------------------
@@ -307,11 +368,10 @@ def plot_confidences(frame_indices, frame_predictions, frame_confidences, frame_
 
     fig.tight_layout(rect=[0, 0, 1, 0.97])
 
-    temp_dir = tempfile.mkdtemp()
-    save_path = os.path.join(temp_dir, "confidence_plot.png")
-    plt.savefig(save_path, bbox_inches="tight")
-    plt.close(fig)
-    return save_path
+    # Render to PNG bytes in memory, no temp file
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
 
 # ===============================
 # Utility: Convert numpy types to native Python types
@@ -327,17 +387,24 @@ def to_python(obj):
         return obj.tolist()
     return obj
 
-def threaded_predict(file_path, has_text):
-    temp_dir = tempfile.mkdtemp()
+def threaded_predict(file_path, has_text, on_progress=None, progress_every=10,
+                     early_stop_confidence=None, min_face_frames=30, stop_event=None):
     start = time.time()
 
     # ✅ Run inference
-    response = analyze_video(file_path)
+    response = analyze_video(file_path, on_progress=on_progress, progress_every=progress_every,
+                             early_stop_confidence=early_stop_confidence,
+                             min_face_frames=min_face_frames, stop_event=stop_event)
    
-    frame_indices, frame_predictions, frame_confidences, frame_raw_probs, frame_raw_inputs = response
+    frame_indices, frame_predictions, frame_confidences, frame_raw_probs, frame_raw_inputs, frame_boxes, early_stopped = response
+
+    # Aborted (e.g. client disconnected) → skip plotting, frame grabs, OCR and encoding
+    if stop_event is not None and stop_event.is_set():
+        print(f"⏹️ threaded predict aborted after {time.time() - start:.2f}s")
+        return None
 
     # ✅ Save confidence plot
-    plot_path = plot_confidences(frame_indices, frame_predictions, frame_confidences, frame_raw_probs, label_map)
+    plot_png = plot_confidences(frame_indices, frame_predictions, frame_confidences, frame_raw_probs, label_map)
 
     # ✅ Collect confidences per label
     label_confidences = {"real": [], "deepfake_og": [], "deepfake_latest": []}
@@ -353,6 +420,13 @@ def threaded_predict(file_path, has_text):
             label_confidences[label].append(to_python(conf))
 
     avg_probs = sum_probs / max(count, 1)
+
+    # The early verdict is judged over face frames only, so report it separately
+    # instead of changing what final_prediction_confidence means
+    early_verdict_confidence = None
+    if early_stopped:
+        face_probs = [proba for proba, label in zip(frame_raw_probs, frame_predictions) if label != "no_face"]
+        early_verdict_confidence = float(np.max(np.mean(face_probs, axis=0)))
     avg_real_conf = label_confidences["real"] and (sum(label_confidences["real"]) / len(label_confidences["real"])) or 0.0
     avg_deepfake_og_conf = label_confidences["deepfake_og"] and (sum(label_confidences["deepfake_og"]) / len(label_confidences["deepfake_og"])) or 0.0
     avg_deepfake_latest_conf = label_confidences["deepfake_latest"] and (sum(label_confidences["deepfake_latest"]) / len(label_confidences["deepfake_latest"])) or 0.0
@@ -369,34 +443,42 @@ def threaded_predict(file_path, has_text):
     ]
     suspicious_frames.sort(key=lambda x: x[2], reverse=True)
 
-    suspicious_paths = []
+    # ✅ Grab suspicious frames, then encode thumbnails in parallel (no temp files)
+    grabbed, jobs = [], []
     cap = cv2.VideoCapture(file_path)
     for rank, (i, label, conf) in enumerate(suspicious_frames[:10], 1):
         cap.set(cv2.CAP_PROP_POS_FRAMES, i)
         ret, frame = cap.read()
         if ret:
-            save_path = os.path.join(temp_dir, f"top_suspicious_{rank}_frame_{i}.png")
             frame = remove_text(frame) if has_text else frame
-            cv2.imwrite(save_path, frame)
-            suspicious_paths.append({
-                "frame_index": int(i),
-                "label": label,
-                "confidence": float(conf),
-                "path": save_path
-            })
+            grabbed.append((rank, i, label, conf))
+            jobs.append({"img": frame, "boxes": frame_boxes[i], "label": f"{label} {conf:.2f}"})
     cap.release()
 
+    suspicious_paths = []
+    for (rank, i, label, conf), artifact in zip(grabbed, encode_artifacts(jobs)):
+        suspicious_paths.append({
+            "frame_index": int(i),
+            "label": label,
+            "confidence": float(conf),
+            "filename": f"top_suspicious_{rank}_frame_{i}{artifact['ext']}",
+            "data": artifact["data"],
+            "content_type": artifact["content_type"],
+        })
+
     end = time.time()
     print(end-start, 'is total time taken for threaded predict')
 
     # ✅ Return JSON-safe response
     return {
-        "confidence_plot": plot_path,
+        "confidence_plot": plot_png,
         "suspicious_frames": suspicious_paths,
         "avg_real_confidence": float(avg_real_conf),
         "avg_deepfake_og_confidence": float(avg_deepfake_og_conf),
         "avg_deepfake_latest_confidence": float(avg_deepfake_latest_conf),
         "total_frames": int(len(frame_indices)),
+        "early_stopped": early_stopped,
+        "early_verdict_confidence": early_verdict_confidence,
         "final_prediction": final_pred_label,
         "final_prediction_confidence": float(final_pred_confidence),
         "time_taken": float(end - start)
@@ -0,0 +1,79 @@
+# backend/loadtest.py
+#
+# Mixed-traffic load test for /analyze: a burst of videos plus a steady
+# stream of images, reporting latency percentiles per type and how many
+# requests were shed with 429/503.
+#
+#   python loadtest.py --url http://localhost:8000 --image face.jpg --video clip.mp4 \
+#       --images 100 --videos 10 --image-rate 5
+
+import os
+import time
+import asyncio
+import argparse
+import mimetypes
+from collections import Counter
+import httpx
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[k]
+
+
+async def send(client, url, path, kind, latencies, statuses):
+    with open(path, "rb") as f:
+        data = f.read()
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    start = time.perf_counter()
+    try:
+        response = await client.post(
+            f"{url}/analyze",
+            files={"file": (os.path.basename(path), data, content_type)},
+        )
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    elapsed = time.perf_counter() - start
+    statuses[kind][status] += 1
+    if status == 200:
+        latencies[kind].append(elapsed)
+
+
+async def main(args):
+    latencies = {"image": [], "video": []}
+    statuses = {"image": Counter(), "video": Counter()}
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        # Videos arrive as a burst up front, images trickle in at a fixed rate
+        tasks = [
+            asyncio.create_task(send(client, args.url, args.video, "video", latencies, statuses))
+            for _ in range(args.videos)
+        ]
+        for _ in range(args.images):
+            tasks.append(asyncio.create_task(send(client, args.url, args.image, "image", latencies, statuses)))
+            await asyncio.sleep(1 / args.image_rate)
+        await asyncio.gather(*tasks)
+
+    for kind in ("image", "video"):
+        lat = latencies[kind]
+        print(f"=== {kind}s ===")
+        print(f"  statuses: {dict(statuses[kind])}")
+        if lat:
+            print(f"  p50: {percentile(lat, 50):.2f}s  p95: {percentile(lat, 95):.2f}s  "
+                  f"p99: {percentile(lat, 99):.2f}s  max: {max(lat):.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mixed image/video load test for /analyze")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--image", required=True, help="sample image file")
+    parser.add_argument("--video", required=True, help="sample video file")
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--videos", type=int, default=10)
+    parser.add_argument("--image-rate", type=float, default=5.0, help="images per second")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    asyncio.run(main(parser.parse_args()))
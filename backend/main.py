@@ -1,5 +1,5 @@
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 import tempfile
 import os
@@ -7,8 +7,15 @@ import time
 import random
 import hashlib
 import traceback
+import json
+import asyncio
+import threading
+from contextlib import AsyncExitStack
 from supabase_utils import upload_to_supabase
 from app.predict import threaded_predict, predict_image
+from app.admission import admission, estimate_cost, IMAGE, VIDEO
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import Optional
 import uuid
 import secrets
@@ -34,6 +41,176 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# Allowed types
+allowed_video_types = ['video/mp4', 'video/avi', 'video/mov', 'video/wmv', 'video/flv', 'video/webm']
+allowed_image_types = ['image/jpeg', 'image/png', 'image/jpg']
+
+# Early-verdict defaults for /analyze/stream
+EARLY_STOP_CONFIDENCE = float(os.getenv("EARLY_STOP_CONFIDENCE", 0.9))
+MIN_FACE_FRAMES = int(os.getenv("MIN_FACE_FRAMES", 30))
+
+# Keep references to streaming analyses so they are not garbage collected mid-run
+_stream_tasks = set()
+
+def save_upload_bytes(file_content, suffix):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(file_content)
+        return tmp.name
+
+
+async def save_upload(file, allowed_types, content_hash):
+    """
+    Validate type and size of an upload and save it to a temporary file.
+    Returns (temp_file_path, file_size, suffix, content_hash) with a fallback content_hash filled in.
+    """
+    if file.content_type not in allowed_types:
+        raise HTTPException(status_code=400, detail=f"Invalid file type. Allowed: {', '.join(allowed_types)}")
+
+    # Check file size (max 50MB)
+    file_content = await file.read()
+    file_size = len(file_content)
+    if file_size > 50 * 1024 * 1024:
+        raise HTTPException(status_code=413, detail="File size exceeds allowed limit")
+
+    # Save uploaded file temporarily
+    suffix = os.path.splitext(file.filename)[1] or ".dat"
+    temp_file_path = await run_in_threadpool(save_upload_bytes, file_content, suffix)
+
+    # Generate fallback content_hash if not provided
+    if not content_hash:
+        content_hash = f"file_{int(time.time())}"
+
+    return temp_file_path, file_size, suffix, content_hash
+
+
+def remove_temp_file(temp_file_path):
+    if temp_file_path and os.path.exists(temp_file_path):
+        try:
+            os.unlink(temp_file_path)
+            print(f"Temporary file cleaned up: {temp_file_path}")
+        except Exception as e:
+            print(f"Failed to clean up temporary file: {e}")
+
+
+def build_video_response(results, temp_file_path, suffix, user_id, content_hash):
+    """Upload video artifacts to Supabase and build the /analyze response."""
+    # Upload confidence plot
+    timeseries_url = ""
+    timeseries_url_supabase = ""
+    try:
+        base_url = "https://opmkhhuupytffsqsonnk.supabase.co/storage/v1/object/public/heatmaps"
+        folder_url = f"{base_url}/{user_id}/{content_hash}"
+
+        supabase_path = f"{user_id}/{content_hash}/timeseries.png"
+        timeseries_url_supabase = f"{folder_url}/{supabase_path}"
+        timeseries_url = upload_to_supabase(supabase_path, results["confidence_plot"], "image/png")
+    except Exception as e:
+        print(f"Failed to upload confidence plot: {e}")
+
+    # Upload suspicious frames
+    suspicious_urls = []
+    heatmapurls = []
+    for sf in results["suspicious_frames"]:
+        try:
+            base_url = "https://opmkhhuupytffsqsonnk.supabase.co/storage/v1/object/public/heatmaps"
+            folder_url = f"{base_url}/{user_id}/{content_hash}"
+            heatmapurl =  f"{folder_url}/{sf['filename']}"
+            heatmapurls.append(heatmapurl)
+            supabase_path = f"{user_id}/{content_hash}/{sf['filename']}"
+            url = upload_to_supabase(supabase_path, sf["data"], sf["content_type"])
+            suspicious_urls.append({
+                "frame_index": sf["frame_index"],
+                "confidence": sf["confidence"],
+                "url": url
+            })
+        except Exception as e:
+            print(f"Failed to upload suspicious frame {sf['frame_index']}: {e}")
+
+    # Upload original video
+    video_url = ""
+    try:
+        with open(temp_file_path, "rb") as f:
+            supabase_path = f"{user_id}/{content_hash}/video{suffix}"
+            video_url = upload_to_supabase(supabase_path, f.read())
+    except Exception as e:
+        print(f"Failed to upload original video: {e}")
+    #  "confidence_plot": plot_path,
+    # "suspicious_frames": suspicious_paths,
+    # "avg_real_confidence": avg_real_conf,
+    # "avg_deepfake_og_confidence": avg_deepfake_og_conf,
+    # "avg_deepfake_latest_confidence": avg_deepfake_latest_conf,
+    # "total_frames": len(frame_indices),
+    # "final_prediction": final_pred_label,
+    # "final_prediction_confidence": final_pred_confidence,
+    # "time_taken": end - start
+    return {
+        "type": "video",
+        "content_hash": content_hash,
+        "avg_real_confidence": results["avg_real_confidence"],
+        "avg_deepfake_og_confidence": results["avg_deepfake_og_confidence"],
+        "avg_deepfake_confidence": results["avg_deepfake_latest_confidence"],
+        "total_frames": results["total_frames"],
+        "timeseries_plot": timeseries_url,
+        "heatmap_urls": heatmapurls,
+        "file_url": video_url,
+        "prediction": results["final_prediction"],
+        "prediction_confidence": results["final_prediction_confidence"],
+        "time_taken": results["time_taken"],
+        "early_stopped": results["early_stopped"],
+        "early_verdict_confidence": results["early_verdict_confidence"],
+    }
+
+
+def build_image_response(results, temp_file_path, filename, user_id, content_hash):
+    """Upload image artifacts to Supabase and build the /analyze response."""
+    image_plot_url = ""
+    try:
+        annotated = results["annotated_image"]
+        supabase_path = f"{user_id}/{content_hash}/prediction_plot{annotated['ext']}"
+        image_plot_url = upload_to_supabase(supabase_path, annotated["data"], annotated["content_type"])
+    except Exception as e:
+        print(f"Failed to upload prediction plot: {e}")
+
+    image_url = ""
+    try:
+        with open(temp_file_path, "rb") as f:
+            supabase_path = f"{user_id}/{content_hash}/{filename}"
+            image_url = upload_to_supabase(supabase_path, f.read())
+    except Exception as e:
+        print(f"Failed to upload original image: {e}")
+    
+    return {
+        "type": "image",
+        "content_hash": content_hash,
+        "prediction": results["prediction"],
+        "image_url": image_plot_url,
+        "file_url": image_url,
+        "avg_real_confidence": results["real_confidence"],
+        "avg_deepfake_og_confidence": results["deepfake_og_confidence"], 
+        "avg_deepfake_confidence": results["deepfake_confidence"],
+        "time_taken": results["time_taken"],
+        "total_frames":1,
+        "prediction_confidence": results["prediction_confidence"],
+
+
+
+        #  "type": "video",
+        # "content_hash": content_hash,
+        # "avg_real_confidence": results["avg_real_confidence"],
+        # "avg_deepfake_og_confidence": results["avg_deepfake_og_confidence"],
+        # "avg_deepfake_confidence": results["avg_deepfake_latest_confidence"],
+        # "total_frames": results["total_frames"],
+        # "timeseries_plot": timeseries_url,
+        # "heatmap_urls": heatmapurls,
+        # "video_url": video_url,
+        # "prediction": results["final_prediction"],
+        # "prediction_confidence": results["final_prediction_confidence"],
+        # "time_taken": results["time_taken"],
+
+    }
+
+
 @app.post("/analyze")
 async def analyze_file(
     file: UploadFile = File(...),
@@ -45,150 +222,33 @@ async def analyze_file(
     try:
         print("=== Starting file analysis endpoint ===")
         user_id = "public_user"
-        # Allowed types
-        allowed_video_types = ['video/mp4', 'video/avi', 'video/mov', 'video/wmv', 'video/flv', 'video/webm']
-        allowed_image_types = ['image/jpeg', 'image/png', 'image/jpg']
-
-        if file.content_type not in allowed_video_types + allowed_image_types:
-            raise HTTPException(status_code=400, detail=f"Invalid file type. Allowed: {', '.join(allowed_video_types + allowed_image_types)}")
-
-        # Check file size (max 100MB)
-        file_content = await file.read()
-        file_size = len(file_content)
-        if file_size > 50 * 1024 * 1024:
-            raise HTTPException(status_code=413, detail="File size exceeds allowed limit")
-
-        # Save uploaded file temporarily
-        suffix = os.path.splitext(file.filename)[1] or ".dat"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(file_content)
-            temp_file_path = tmp.name
+        temp_file_path, file_size, suffix, content_hash = await save_upload(
+            file, allowed_video_types + allowed_image_types, content_hash
+        )
 
-        # Generate fallback content_hash if not provided
-        if not content_hash:
-            content_hash = f"file_{int(time.time())}"
+        # Estimate cost from metadata and pick a priority lane
+        lane = VIDEO if file.content_type in allowed_video_types else IMAGE
+        cost = await run_in_threadpool(estimate_cost, temp_file_path, lane, file_size)
+        print(f"Admission: lane={lane}, cost={cost:.1f}, {admission.stats()}")
 
         # === Handle Video ===
         if file.content_type in allowed_video_types:
-            results = threaded_predict(temp_file_path, has_text=has_text)
-
-            # Upload confidence plot
-            timeseries_url = ""
-            timeseries_url_supabase = ""
-            try:
-                with open(results["confidence_plot"], "rb") as f:
-                    base_url = "https://opmkhhuupytffsqsonnk.supabase.co/storage/v1/object/public/heatmaps"
-                    folder_url = f"{base_url}/{user_id}/{content_hash}"
-                       
-                    supabase_path = f"{user_id}/{content_hash}/timeseries.png"
-                    timeseries_url_supabase = f"{folder_url}/{supabase_path}"
-                    timeseries_url = upload_to_supabase(supabase_path, f.read())
-            except Exception as e:
-                print(f"Failed to upload confidence plot: {e}")
-
-            # Upload suspicious frames
-            suspicious_urls = []
-            heatmapurls = []
-            for sf in results["suspicious_frames"]:
-                try:
-                    with open(sf["path"], "rb") as f:
-                        base_url = "https://opmkhhuupytffsqsonnk.supabase.co/storage/v1/object/public/heatmaps"
-                        folder_url = f"{base_url}/{user_id}/{content_hash}"
-                        heatmapurl =  f"{folder_url}/{os.path.basename(sf['path'])}"
-                        heatmapurls.append(heatmapurl)
-                        supabase_path = f"{user_id}/{content_hash}/{os.path.basename(sf['path'])}"
-                        url = upload_to_supabase(supabase_path, f.read())
-                        suspicious_urls.append({
-                            "frame_index": sf["frame_index"],
-                            "confidence": sf["confidence"],
-                            "url": url
-                        })
-                except Exception as e:
-                    print(f"Failed to upload suspicious frame {sf['frame_index']}: {e}")
-
-            # Upload original video
-            video_url = ""
-            try:
-                with open(temp_file_path, "rb") as f:
-                    supabase_path = f"{user_id}/{content_hash}/video{suffix}"
-                    video_url = upload_to_supabase(supabase_path, f.read())
-            except Exception as e:
-                print(f"Failed to upload original video: {e}")
-        #  "confidence_plot": plot_path,
-        # "suspicious_frames": suspicious_paths,
-        # "avg_real_confidence": avg_real_conf,
-        # "avg_deepfake_og_confidence": avg_deepfake_og_conf,
-        # "avg_deepfake_latest_confidence": avg_deepfake_latest_conf,
-        # "total_frames": len(frame_indices),
-        # "final_prediction": final_pred_label,
-        # "final_prediction_confidence": final_pred_confidence,
-        # "time_taken": end - start
-            return {
-                "type": "video",
-                "content_hash": content_hash,
-                "avg_real_confidence": results["avg_real_confidence"],
-                "avg_deepfake_og_confidence": results["avg_deepfake_og_confidence"],
-                "avg_deepfake_confidence": results["avg_deepfake_latest_confidence"],
-                "total_frames": results["total_frames"],
-                "timeseries_plot": timeseries_url,
-                "heatmap_urls": heatmapurls,
-                "file_url": video_url,
-                "prediction": results["final_prediction"],
-                "prediction_confidence": results["final_prediction_confidence"],
-                "time_taken": results["time_taken"],
-
-            }
+            async with admission.admit(lane, cost):
+                results = await admission.run(lane, threaded_predict, temp_file_path, has_text=has_text)
+
+            return await run_in_threadpool(
+                build_video_response, results, temp_file_path, suffix, user_id, content_hash
+            )
         
 
         # === Handle Image ===
         elif file.content_type in allowed_image_types:
-            results = predict_image(temp_file_path,  has_text=has_text)
-
-            image_plot_url = ""
-            try:
-                with open(results["saved_plot"], "rb") as f:
-                    supabase_path = f"{user_id}/{content_hash}/prediction_plot.png"
-                    image_plot_url = upload_to_supabase(supabase_path, f.read())
-            except Exception as e:
-                print(f"Failed to upload prediction plot: {e}")
-
-            image_url = ""
-            try:
-                with open(temp_file_path, "rb") as f:
-                    supabase_path = f"{user_id}/{content_hash}/{file.filename}"
-                    image_url = upload_to_supabase(supabase_path, f.read())
-            except Exception as e:
-                print(f"Failed to upload original image: {e}")
-            
-            return {
-                "type": "image",
-                "content_hash": content_hash,
-                "prediction": results["prediction"],
-                "image_url": image_plot_url,
-                "file_url": image_url,
-                "avg_real_confidence": results["real_confidence"],
-                "avg_deepfake_og_confidence": results["deepfake_og_confidence"], 
-                "avg_deepfake_confidence": results["deepfake_confidence"],
-                "time_taken": results["time_taken"],
-                "total_frames":1,
-                "prediction_confidence": results["prediction_confidence"],
-
-
-
-                #  "type": "video",
-                # "content_hash": content_hash,
-                # "avg_real_confidence": results["avg_real_confidence"],
-                # "avg_deepfake_og_confidence": results["avg_deepfake_og_confidence"],
-                # "avg_deepfake_confidence": results["avg_deepfake_latest_confidence"],
-                # "total_frames": results["total_frames"],
-                # "timeseries_plot": timeseries_url,
-                # "heatmap_urls": heatmapurls,
-                # "video_url": video_url,
-                # "prediction": results["final_prediction"],
-                # "prediction_confidence": results["final_prediction_confidence"],
-                # "time_taken": results["time_taken"],
-
-            }
+            async with admission.admit(lane, cost):
+                results = await admission.run(lane, predict_image, temp_file_path, has_text=has_text)
+
+            return await run_in_threadpool(
+                build_image_response, results, temp_file_path, file.filename, user_id, content_hash
+            )
 
 
     except HTTPException:
@@ -198,13 +258,123 @@ async def analyze_file(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
     finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-                print(f"Temporary file cleaned up: {temp_file_path}")
-            except Exception as e:
-                print(f"Failed to clean up temporary file: {e}")
+        remove_temp_file(temp_file_path)
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/analyze/stream")
+async def analyze_file_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    content_hash: str = Form(None),
+    has_text: bool = Form(False),
+    early_stop: bool = Form(True),
+    early_stop_confidence: float = Form(EARLY_STOP_CONFIDENCE),
+    min_face_frames: int = Form(MIN_FACE_FRAMES),
+    progress_every: int = Form(10),
+):
+    """
+    Stream video analysis as Server-Sent Events:
+    `progress` per window of frames with running averages, `verdict` when the
+    running prediction passes early_stop_confidence, then `result` (same body as /analyze) or `error`.
+    """
+    temp_file_path = None
+    stack = AsyncExitStack()
+
+    try:
+        print("=== Starting streaming analysis endpoint ===")
+        user_id = "public_user"
+        if not 0 < early_stop_confidence <= 1:
+            raise HTTPException(status_code=400, detail="early_stop_confidence must be in (0, 1]")
+        if min_face_frames < 1:
+            raise HTTPException(status_code=400, detail="min_face_frames must be at least 1")
+        if progress_every < 1:
+            raise HTTPException(status_code=400, detail="progress_every must be at least 1")
+
+        temp_file_path, file_size, suffix, content_hash = await save_upload(file, allowed_video_types, content_hash)
+
+        # Admit before the stream starts so 429/503 are real HTTP statuses
+        cost = await run_in_threadpool(estimate_cost, temp_file_path, VIDEO, file_size)
+        print(f"Admission: lane={VIDEO}, cost={cost:.1f}, {admission.stats()}")
+        await stack.enter_async_context(admission.admit(VIDEO, cost))
+    except Exception as e:
+        await stack.aclose()
+        remove_temp_file(temp_file_path)
+        if isinstance(e, HTTPException):
+            raise
+        print("=== UNEXPECTED ERROR in analyze_file_stream ===")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop_event = threading.Event()
+
+    def on_progress(summary):
+        # Called from the worker thread
+        event = "verdict" if summary["early_stopped"] else "progress"
+        loop.call_soon_threadsafe(queue.put_nowait, (event, summary))
+
+    async def watch_disconnect():
+        # The response body may never be iterated (client gone before headers),
+        # so events() cannot be the only place that notices a disconnect
+        while not stop_event.is_set():
+            if await request.is_disconnected():
+                print("Client disconnected, stopping streaming analysis")
+                stop_event.set()
+                break
+            await asyncio.sleep(0.5)
+
+    async def run():
+        # Owns the admission slot and temp file, so both are released even if the client disconnects
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            results = await admission.run(
+                VIDEO, threaded_predict, temp_file_path, has_text=has_text,
+                on_progress=on_progress, progress_every=progress_every,
+                early_stop_confidence=early_stop_confidence if early_stop else None,
+                min_face_frames=min_face_frames, stop_event=stop_event,
+            )
+            if results is not None and not stop_event.is_set():
+                response = await run_in_threadpool(
+                    build_video_response, results, temp_file_path, suffix, user_id, content_hash
+                )
+                queue.put_nowait(("result", response))
+        except Exception as e:
+            print("=== UNEXPECTED ERROR in analyze_file_stream ===")
+            traceback.print_exc()
+            queue.put_nowait(("error", {"detail": f"Processing failed: {str(e)}"}))
+        finally:
+            watcher.cancel()
+            await stack.aclose()
+            remove_temp_file(temp_file_path)
+            queue.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    _stream_tasks.add(task)
+    task.add_done_callback(_stream_tasks.discard)
+
+    async def events():
+        try:
+            yield sse_event("started", {"content_hash": content_hash, "cost": cost})
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield sse_event(*item)
+        finally:
+            # Client disconnected or stream finished → stop any remaining analysis
+            stop_event.set()
 
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 
@@ -216,6 +386,7 @@ def health_check():
         "service": "Deepfake Detection API",
         "version": "1.0.0",
         "mode": "mock",
+        "admission": admission.stats(),
     }
 
 @app.get("/")
@@ -225,6 +396,7 @@ def root():
         "message":" Welcome to the Deepfake Detection API. Use the /analyze endpoint to analyze videos or images. ",
         "version": "1.0.0",
         "/analyze": "POST endpoint to analyze videos or images.",
+        "/analyze/stream": "POST endpoint streaming video analysis progress as Server-Sent Events.",
         "/health": "GET endpoint for health check.",
         
     }
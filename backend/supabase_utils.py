@@ -8,16 +8,23 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def upload_to_supabase(path: str, file_bytes: bytes) -> str:
-    # ✅ Determine content-type from file extension
+def _content_type_for(path: str) -> str:
     if path.endswith(".png"):
-        content_type = "image/png"
-    elif path.endswith(".mp4"):
-        content_type = "video/mp4"
-    elif path.endswith(".mp3"):
-        content_type = "audio/mpeg"
-    else:
-        content_type = "application/octet-stream"
+        return "image/png"
+    if path.endswith((".jpg", ".jpeg")):
+        return "image/jpeg"
+    if path.endswith(".webp"):
+        return "image/webp"
+    if path.endswith(".mp4"):
+        return "video/mp4"
+    if path.endswith(".mp3"):
+        return "audio/mpeg"
+    return "application/octet-stream"
+
+def upload_to_supabase(path: str, file_bytes: bytes, content_type: str = None) -> str:
+    # ✅ Determine content-type from file extension (unless the caller knows it)
+    if content_type is None:
+        content_type = _content_type_for(path)
 
     # ✅ Upload to Supabase
     response = supabase.storage.from_("heatmaps").upload(